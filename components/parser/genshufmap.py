@@ -1,66 +1,45 @@
 import argparse
-import itertools
 import json
 import re
 import sys
-from dataclasses import dataclass
-from functools import reduce
-from operator import attrgetter, or_, itemgetter
-from typing import List, Dict, TypeVar, Iterable, Callable, Tuple, Iterator
+from array import array
+from collections import defaultdict
+from operator import itemgetter
+from typing import List, Dict, TypeVar, Iterable, Callable, Tuple
 
 T = TypeVar("T")
 U = TypeVar("U")
 
-
-@dataclass
-class Item:
-    chr: str
-    ord: int
-    high: int
-    low: int
-
-
-def group_by_unsorted(iterable: Iterable[T], key: Callable[[T], U]) -> Iterator[Tuple[U, Iterator[T]]]:
-    return itertools.groupby(sorted(iterable, key=key), key=key)
+ASCII_CHARS = "".join(map(chr, range(128)))
 
 
 def dict_by_unsorted(iterable: Iterable[T], key: Callable[[T], U]) -> Dict[U, List[T]]:
-    return {
-        k: list(iterator)
-        for k, iterator in group_by_unsorted(iterable, key)
-    }
-
-
-def bit_mask(idx_bits: Iterable[int]) -> int:
-    return reduce(or_, map(lambda x: (1 << x), idx_bits), 0)
+    result: Dict[U, List[T]] = defaultdict(list)
+    for item in iterable:
+        result[key(item)].append(item)
+    return result
 
 
-def shufti_mask(values: List[int], bit: int) -> List[int]:
-    return [(1 << bit) if i in values else 0 for i in range(16)]
-
-
-def or_shufti_masks(left: List[int], right: List[int]) -> List[int]:
-    return [l | r for l, r in zip(left, right)]
+def bit_range_mask(start: int, count: int) -> int:
+    return ((1 << count) - 1) << start
 
 
 def debug_nibble_lists(l: List[Tuple[List[int], List[int]]]) -> None:
     for i, (highs, lows) in enumerate(l):
-        chars = "".join([chr(high << 4 | low) for high, low in itertools.product(highs, lows)]) \
-            .encode("unicode_escape").decode("ascii")
+        chars = bytes(high << 4 | low for high in highs for low in lows) \
+            .decode("latin-1").encode("unicode_escape").decode("ascii")
         if highs:
             print(f"Bit {i}: {chars} (high={highs}, low={lows})", file=sys.stderr)
 
 
-def build_nibble_masks(l: List[Tuple[List[int], List[int]]], cat_bit: int) -> Tuple[List[int], List[int]]:
-    return (
-        reduce(or_shufti_masks, [
-            shufti_mask(highs, i)
-            for i, (highs, _) in enumerate(l, start=cat_bit)
-        ], [0] * 16),
-        reduce(or_shufti_masks, [
-            shufti_mask(lows, i)
-            for i, (_, lows) in enumerate(l, start=cat_bit)
-        ], [0] * 16))
+def build_nibble_masks(
+        l: List[Tuple[List[int], List[int]]], cat_bit: int, high_mask: List[int], low_mask: List[int]) -> None:
+    for i, (highs, lows) in enumerate(l, start=cat_bit):
+        bit = 1 << i
+        for high in highs:
+            high_mask[high] |= bit
+        for low in lows:
+            low_mask[low] |= bit
 
 
 def build_shufti_masks(cats: List[str], verbose: bool) -> Tuple[List[int], List[int], List[int]]:
@@ -71,37 +50,39 @@ def build_shufti_masks(cats: List[str], verbose: bool) -> Tuple[List[int], List[
 
     cat_bit = 0
     for cat in cats:
-        items: List[Item] = []
-        for c in cat:
-            items.append(Item(c, ord(c), low=ord(c) & 0x0f, high=ord(c) >> 4))
+        if any(ord(c) > 0x7f for c in cat):
+            print(f"error: only ASCII characters are supported: '{cat}'", file=sys.stderr)
+            sys.exit(1)
+
+        highs = array("B", [ord(c) >> 4 for c in cat])
+        lows = array("B", [ord(c) & 0x0f for c in cat])
+        indices = range(len(cat))
 
         # try to reduce on high bits
-        hreduce: Dict[int, List[Item]] = dict_by_unsorted(items, attrgetter("high"))
-        hmask1 = [([high], [item.low for item in items]) for high, items in hreduce.items()]
+        hreduce: Dict[int, List[int]] = dict_by_unsorted(indices, highs.__getitem__)
+        hmask1 = [(high, tuple(lows[idx] for idx in idxs)) for high, idxs in sorted(hreduce.items())]
         hmask2 = [
-            ([high[0] for high, _ in items], low_mask)
-            for low_mask, items in group_by_unsorted(hmask1, itemgetter(1))
+            ([high for high, _ in items], list(low_mask))
+            for low_mask, items in sorted(dict_by_unsorted(hmask1, itemgetter(1)).items())
         ]
 
         # try to reduce on low bits
-        lreduce: Dict[int, List[Item]] = dict_by_unsorted(items, attrgetter("low"))
-        lmask1 = [([item.high for item in items], [low]) for low, items in lreduce.items()]
+        lreduce: Dict[int, List[int]] = dict_by_unsorted(indices, lows.__getitem__)
+        lmask1 = [(tuple(highs[idx] for idx in idxs), low) for low, idxs in sorted(lreduce.items())]
         lmask2 = [
-            (high_mask, [low[0] for _, low in items])
-            for high_mask, items in group_by_unsorted(lmask1, itemgetter(0))
+            (list(high_mask), [low for _, low in items])
+            for high_mask, items in sorted(dict_by_unsorted(lmask1, itemgetter(0)).items())
         ]
 
         mask = hmask2 if len(hmask2) < len(lmask2) else lmask2
-        cat_shufti_mask = build_nibble_masks(mask, cat_bit)
         n_cat_bits = len(mask)
         if cat_bit + n_cat_bits >= 8:
             print("error: no solution found, try to reduce characters", file=sys.stderr)
             sys.exit(1)
 
-        cat_mask = bit_mask(range(cat_bit, cat_bit + n_cat_bits))
+        cat_mask = bit_range_mask(cat_bit, n_cat_bits)
 
-        high_mask = or_shufti_masks(high_mask, cat_shufti_mask[0])
-        low_mask = or_shufti_masks(low_mask, cat_shufti_mask[1])
+        build_nibble_masks(mask, cat_bit, high_mask, low_mask)
         cat_bit += n_cat_bits
         cat_masks.append(cat_mask)
         if verbose:
@@ -117,7 +98,8 @@ def main():
     argparser = argparse.ArgumentParser()
     argparser.add_argument("inputs", metavar="INPUT", nargs="+")
     argparser.add_argument("--regex", "-R", action="store_true")
-    argparser.add_argument("--format", "-f", type=str, default="rust")
+    argparser.add_argument("--format", "-f", choices=["rust", "avx2", "avx512", "rust-fn"], default="rust")
+    argparser.add_argument("--name", "-n", type=str, default="classify")
     argparser.add_argument("--verbose", "-v", action="store_true")
 
     args = argparser.parse_args()
@@ -126,19 +108,45 @@ def main():
     verbose = args.verbose
     if args.regex:
         regexes = [re.compile(f"[{inp}]") for inp in inputs]
-        inputs = [
-            "".join([chr(i) for i in range(128) if regex.fullmatch(chr(i))])
-            for regex in regexes
-        ]
+        inputs = ["".join(regex.findall(ASCII_CHARS)) for regex in regexes]
 
     masks, high, low = build_shufti_masks(inputs, verbose=verbose)
+    masks_hex = ", ".join(map(hex, masks))
+    high_hex = ", ".join(map(hex, high))
+    low_hex = ", ".join(map(hex, low))
     if format == "rust":
-        print(f"let high_nibble_mask: __m128i = _mm_setr_epi8({', '.join([hex(h) for h in high])});")
-        print(f"let low_nibble_mask: __m128i = _mm_setr_epi8({', '.join([hex(h) for h in low])});")
-        print(f"let category_masks: &[u8] = &[{', '.join([hex(m) for m in masks])}];")
-    else:
-        print(f"error: unknown format '{format}'", file=sys.stderr)
-        sys.exit(1)
+        sys.stdout.write(
+            "let high_nibble_mask: __m128i = _mm_setr_epi8(%s);\n"
+            "let low_nibble_mask: __m128i = _mm_setr_epi8(%s);\n"
+            "let category_masks: &[u8] = &[%s];\n"
+            % (high_hex, low_hex, masks_hex))
+    elif format in ("avx2", "avx512"):
+        vector_type, broadcast = {
+            "avx2": ("__m256i", "_mm256_broadcastsi128_si256"),
+            "avx512": ("__m512i", "_mm512_broadcast_i32x4"),
+        }[format]
+        sys.stdout.write(
+            "let high_nibble_mask: %s = %s(_mm_setr_epi8(%s));\n"
+            "let low_nibble_mask: %s = %s(_mm_setr_epi8(%s));\n"
+            "let category_masks: &[u8] = &[%s];\n"
+            % (vector_type, broadcast, high_hex, vector_type, broadcast, low_hex, masks_hex))
+    elif format == "rust-fn":
+        sys.stdout.write(
+            "pub const %s_CATEGORY_MASKS: [u8; %d] = [%s];\n"
+            "\n"
+            "#[target_feature(enable = \"ssse3\")]\n"
+            "pub unsafe fn %s(chunk: __m128i) -> __m128i {\n"
+            "    let high_nibble_mask: __m128i = _mm_setr_epi8(%s);\n"
+            "    let low_nibble_mask: __m128i = _mm_setr_epi8(%s);\n"
+            "    _mm_and_si128(\n"
+            "        _mm_shuffle_epi8(low_nibble_mask, _mm_and_si128(chunk, _mm_set1_epi8(0x0f))),\n"
+            "        _mm_shuffle_epi8(\n"
+            "            high_nibble_mask,\n"
+            "            _mm_and_si128(_mm_srli_epi32::<4>(chunk), _mm_set1_epi8(0x0f)),\n"
+            "        ),\n"
+            "    )\n"
+            "}\n"
+            % (args.name.upper(), len(masks), masks_hex, args.name, high_hex, low_hex))
 
 
 if __name__ == '__main__':
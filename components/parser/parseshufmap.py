@@ -1,26 +1,30 @@
 import json
-from itertools import product
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 
 
-def bit_test(bits: int, bit: int) -> bool:
-    return (bits & (1 << bit)) != 0
+def set_bits(bits: int) -> Iterator[int]:
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
 
 
 def debug_nibble_lists(l: List[Tuple[List[int], List[int]]]) -> None:
     for i, (highs, lows) in enumerate(l):
-        chars = json.dumps("".join([chr(high << 4 | low) for high, low in product(highs, lows)]))
+        chars = json.dumps(bytes(high << 4 | low for high in highs for low in lows).decode("latin-1"))
         if highs:
             print(f"Bit {i}: {chars[1:-1]} (high={highs}, low={lows})")
 
 
 def parse_shufti_mask(high: List[int], low: List[int]) -> List[Tuple[List[int], List[int]]]:
-    return [
-        (
-            [j for j, e in enumerate(high) if bit_test(e, i)],
-            [j for j, e in enumerate(low) if bit_test(e, i)]
-        ) for i in range(8)
-    ]
+    result: List[Tuple[List[int], List[int]]] = [([], []) for _ in range(8)]
+    for j, e in enumerate(high):
+        for i in set_bits(e & 0xff):
+            result[i][0].append(j)
+    for j, e in enumerate(low):
+        for i in set_bits(e & 0xff):
+            result[i][1].append(j)
+    return result
 
 
 def debug_nibble_masks(high: List[int], low: List[int]) -> None: